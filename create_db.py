@@ -7,9 +7,14 @@ from __future__ import annotations
 import argparse
 import csv
 import io
+import json
+import os
 import re
+import string
 import sys
-from typing import Dict, List, Tuple, Optional
+from functools import lru_cache
+from itertools import islice, zip_longest
+from typing import Callable, Dict, List, TextIO, Tuple, Optional
 
 # -----------------------------
 # Type mapping & helpers
@@ -33,43 +38,68 @@ SIMPLE_TYPE_MAP: Dict[str, str] = {
 ENUM_LABELS = {"enum", "enum (multi select)"}
 KNOWN_LABELS = set(SIMPLE_TYPE_MAP.keys()) | ENUM_LABELS
 
+# Precompiled once; this runs O(cols) times per file
+_WS_RE = re.compile(r"\s+")
+
+# Character sets equivalent to the former ^[a-z_][a-z0-9_]*$ regex;
+# frozenset membership/superset checks stay in C and skip the regex engine
+_FIRST_CHARS = frozenset(string.ascii_lowercase + "_")
+_IDENT_CHARS = frozenset(string.ascii_lowercase + string.digits + "_")
+
+# Labels repeat heavily across columns ("string", "enum", ...), so repeat
+# normalizations become a cache hit instead of a strip/lower/regex pass
+@lru_cache(maxsize=256)
 def normalize_sheet_type(label: str) -> str:
     if label is None:
         return ""
-    return re.sub(r"\s+", " ", label.strip().lower())
+    return _WS_RE.sub(" ", label.strip().lower())
 
 def is_valid_identifier(name: str) -> bool:
-    return bool(re.match(r"^[a-z_][a-z0-9_]*$", name or ""))
+    return bool(name) and name[0] in _FIRST_CHARS and _IDENT_CHARS.issuperset(name)
 
+@lru_cache(maxsize=1024)
 def quote_ident(ident: str) -> str:
     if is_valid_identifier(ident):
         return ident
     return '"' + ident.replace('"', '""') + '"'
 
-def map_type(sheet_type_label: str, column_name: str) -> Tuple[str, List[str]]:
-    warnings: List[str] = []
-    key = normalize_sheet_type(sheet_type_label)
-
-    if key == "enum":
-        if not column_name:
-            warnings.append("Enum column without a name; skipped.")
-            return ("", warnings)
-        return (quote_ident(column_name), warnings)
-
-    if key == "enum (multi select)":
-        if not column_name:
-            warnings.append("Enum (multi select) column without a name; skipped.")
-            return ("", warnings)
-        return (f"{quote_ident(column_name)}[]", warnings)
+# Warnings are (code, label, column) tuples so callers can deduplicate
+# repeated labels by (code, label) instead of growing one formatted
+# string per column
+Warning_ = Tuple[str, str, str]
+
+def _map_enum(column_name: str) -> Tuple[str, List[Warning_]]:
+    if not column_name:
+        return ("", [("missing-name", "Enum", column_name)])
+    return (quote_ident(column_name), [])
+
+def _map_enum_array(column_name: str) -> Tuple[str, List[Warning_]]:
+    if not column_name:
+        return ("", [("missing-name", "Enum (multi select)", column_name)])
+    return (f"{quote_ident(column_name)}[]", [])
+
+# Single dispatch table: normalized label -> handler, one hash probe per column
+_TYPE_DISPATCH: Dict[str, Callable[[str], Tuple[str, List[Warning_]]]] = {
+    **{label: (lambda col, t=t: (t, [])) for label, t in SIMPLE_TYPE_MAP.items()},
+    "enum": _map_enum,
+    "enum (multi select)": _map_enum_array,
+}
 
-    if key in SIMPLE_TYPE_MAP:
-        return (SIMPLE_TYPE_MAP[key], warnings)
+def map_type(sheet_type_label: str, column_name: str) -> Tuple[str, List[Warning_]]:
+    key = normalize_sheet_type(sheet_type_label)
+    handler = _TYPE_DISPATCH.get(key)
+    if handler is not None:
+        return handler(column_name)
 
     # Fallback
-    warnings.append(
-        f"Unrecognized type '{sheet_type_label}' for column '{column_name}', defaulting to text."
-    )
-    return ("text", warnings)
+    return ("text", [("unrecognized-type", sheet_type_label, column_name)])
+
+def format_warning(code: str, label: str, count: int) -> str:
+    if code == "unrecognized-type":
+        return f"Unrecognized type '{label}' for {count} column(s), defaulted to text."
+    if code == "missing-name":
+        return f"{label} column without a name; skipped ({count} column(s))."
+    return f"{label} ({count} column(s))."
 
 # -----------------------------
 # Delimiter detection
@@ -77,55 +107,92 @@ def map_type(sheet_type_label: str, column_name: str) -> Tuple[str, List[str]]:
 
 POSSIBLE_DELIMS = [",", "\t", ";", "|"]
 
-def sniff_delimiter(sample: str) -> Optional[str]:
-    # Try Python's Sniffer first
-    try:
-        sniffer = csv.Sniffer()
-        dialect = sniffer.sniff(sample, delimiters="".join(POSSIBLE_DELIMS))
-        if dialect and dialect.delimiter in POSSIBLE_DELIMS:
-            return dialect.delimiter
-    except Exception:
-        pass
-    # Fallback: choose the delimiter that yields the most columns on the first non-empty line
-    lines = [ln for ln in sample.splitlines() if ln.strip()]
-    if not lines:
+def sniff_delimiter(sample: bytes) -> Optional[str]:
+    # Count candidate delimiters over a small raw-byte prefix; the most
+    # frequent wins. All candidates are single ASCII bytes, so detection
+    # needs no decode, and bytes.count is a single C-level pass each.
+    counts = {d: sample.count(d.encode("ascii")) for d in POSSIBLE_DELIMS}
+    best_delim = max(counts, key=counts.get)
+    if counts[best_delim] == 0:
         return None
-    best_delim = None
-    best_count = 0
-    first_line = lines[0]
-    for d in POSSIBLE_DELIMS:
-        count = len(list(csv.reader([first_line], delimiter=d))[0])
-        if count > best_count:
-            best_count = count
-            best_delim = d
     return best_delim
 
+# Best-effort cache of detected delimiters so repeat runs on an unchanged
+# file skip sniffing entirely. Keyed by (abspath, mtime_ns, size); any I/O
+# or JSON problem simply falls back to sniffing.
+
+_DELIM_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "generate_supabase_schema", "delims.json"
+)
+
+def _delim_cache_key(path: str) -> Optional[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}"
+
+def _read_delim_cache() -> Dict[str, str]:
+    # Tolerate a missing, unreadable, or malformed file (including valid
+    # JSON that is not an object); the cache must never break a run
+    try:
+        with open(_DELIM_CACHE_PATH, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def _load_cached_delimiter(key: str) -> Optional[str]:
+    cached = _read_delim_cache().get(key)
+    return cached if cached in POSSIBLE_DELIMS else None
+
+def _store_cached_delimiter(key: str, delim: str) -> None:
+    try:
+        cache = _read_delim_cache()
+        cache[key] = delim
+        os.makedirs(os.path.dirname(_DELIM_CACHE_PATH), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see
+        # a partially written cache
+        tmp_path = f"{_DELIM_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, _DELIM_CACHE_PATH)
+    except OSError:
+        pass
+
 # -----------------------------
 # CSV ingestion
 # -----------------------------
 
-def read_three_row_csv(path: str, delimiter: Optional[str], encoding: str) -> Tuple[List[str], List[str], List[str]]:
+def read_three_row_csv(path: str, delimiter: Optional[str], encoding: str, use_cache: bool = True) -> Tuple[List[str], List[str], List[str]]:
     """
     Read a 3-row CSV/TSV robustly:
-      - Auto-detect delimiter if not provided
+      - Auto-detect delimiter if not provided (cached per file unless use_cache=False)
       - Preserve empty trailing cells
       - If row2 doesn't look like types but row3 does, swap them
     """
-    with open(path, "rb") as fb:
-        raw = fb.read()
-
-    # Decode with specified encoding (default utf-8-sig to strip BOM if present)
-    text = raw.decode(encoding, errors="strict")
-
-    # Determine delimiter if needed
-    used_delim = delimiter or sniff_delimiter(text)
-    if not used_delim:
-        raise ValueError(
-            "Could not detect a delimiter. Try providing --delimiter (e.g., --delimiter '\\t')."
-        )
-
-    reader = csv.reader(io.StringIO(text), delimiter=used_delim)
-    rows: List[List[str]] = [row for row in reader]
+    cache_key = _delim_cache_key(path) if use_cache and not delimiter else None
+    if cache_key and not delimiter:
+        delimiter = _load_cached_delimiter(cache_key)
+    # Open in binary with a large buffer; the delimiter is sniffed on raw
+    # bytes so only the three rows actually parsed get decoded (default
+    # utf-8-sig strips a BOM if present).
+    with open(path, "rb", buffering=1 << 20) as fb:
+        used_delim = delimiter
+        if not used_delim:
+            used_delim = sniff_delimiter(fb.read(8192))
+            if not used_delim:
+                raise ValueError(
+                    "Could not detect a delimiter. Try providing --delimiter (e.g., --delimiter '\\t')."
+                )
+            if cache_key:
+                _store_cached_delimiter(cache_key, used_delim)
+            fb.seek(0)
+
+        text_stream = io.TextIOWrapper(fb, encoding=encoding, newline="")
+        reader = csv.reader(text_stream, delimiter=used_delim)
+        # Stop parsing after the three rows we need; the file may be much longer
+        rows: List[List[str]] = list(islice(reader, 3))
 
     if len(rows) < 3:
         raise ValueError(f"Expected a file with at least 3 rows, got {len(rows)}.")
@@ -135,20 +202,19 @@ def read_three_row_csv(path: str, delimiter: Optional[str], encoding: str) -> Tu
     type_labels = rows[1]
     colnames = rows[2]
 
-    # Normalize lengths to the max number of columns
-    max_len = max(len(desc), len(type_labels), len(colnames))
-    desc += [""] * (max_len - len(desc))
-    type_labels += [""] * (max_len - len(type_labels))
-    colnames += [""] * (max_len - len(colnames))
-
     # Heuristic swap if row2/row3 were flipped
     def looks_like_types(cells: List[str]) -> bool:
-        non_empty = [c for c in cells if c.strip()]
-        if not non_empty:
-            return False
-        normalized = [normalize_sheet_type(c) for c in non_empty]
-        hits = sum(1 for n in normalized if n in KNOWN_LABELS or n.startswith("enum"))
-        return hits / len(non_empty) >= 0.55
+        # Single pass with running counters; KNOWN_LABELS already contains
+        # both enum variants, so no separate startswith("enum") check needed
+        total = 0
+        hits = 0
+        for c in cells:
+            if not c.strip():
+                continue
+            total += 1
+            if normalize_sheet_type(c) in KNOWN_LABELS:
+                hits += 1
+        return total > 0 and hits / total >= 0.55
 
     if not looks_like_types(type_labels) and looks_like_types(colnames):
         type_labels, colnames = colnames, type_labels
@@ -159,12 +225,14 @@ def read_three_row_csv(path: str, delimiter: Optional[str], encoding: str) -> Tu
 # DDL generation
 # -----------------------------
 
-def generate_create_table_sql(table_name: str, descriptions: List[str], type_labels: List[str], colnames: List[str]) -> str:
+def generate_create_table_sql(table_name: str, descriptions: List[str], type_labels: List[str], colnames: List[str], out: Optional[TextIO] = None) -> Optional[str]:
     """
     Generate a CREATE TABLE DDL. Adds:
       - id uuid primary key default gen_random_uuid()
     Ignores columns with missing column name.
     Ensures no trailing comma even when inline comments are present.
+    If `out` is given, the DDL is written there line by line (no joined
+    intermediate string is built) and None is returned.
     """
     table_ident = quote_ident(table_name)
     ddl_lines: List[str] = []
@@ -175,44 +243,54 @@ def generate_create_table_sql(table_name: str, descriptions: List[str], type_lab
     ddl_lines.append(f"  -- Surrogate primary key for internal use")
     ddl_lines.append(f"  id uuid primary key default gen_random_uuid(),")
 
-    warnings: List[str] = []
+    # Deduplicate warnings by (code, label): files full of a repeated bad
+    # label warn once with a count instead of once per column
+    warning_counts: Dict[Tuple[str, str], int] = {}
     cols: List[Tuple[str, str]] = []  # (definition_sql, comment_text)
 
-    # Build normalized column list first
-    for desc, typelab, col in zip(descriptions, type_labels, colnames):
+    # Build normalized column list first; zip_longest pads ragged rows
+    # with "" so no pre-padding pass over the three lists is needed
+    for desc, typelab, col in zip_longest(descriptions, type_labels, colnames, fillvalue=""):
         col = (col or "").strip()
         typelab = (typelab or "").strip()
         if not col:
             continue  # ignore unnamed columns
 
         pg_type, w = map_type(typelab, col)
-        warnings.extend(w)
+        for code, label, _ in w:
+            warning_counts[(code, label)] = warning_counts.get((code, label), 0) + 1
         if not pg_type:
             continue
 
         col_ident = quote_ident(col)
         def_sql = f"{col_ident} {pg_type}"
-        comment_text = re.sub(r"\s+", " ", desc.strip()) if desc.strip() else ""
+        comment_text = _WS_RE.sub(" ", desc.strip()) if desc.strip() else ""
         cols.append((def_sql, comment_text))
 
-    # Emit columns with commas only between items
-    for i, (def_sql, comment_text) in enumerate(cols):
-        is_last = (i == len(cols) - 1)
-        line = f"  {def_sql}"
-        if not is_last:
-            line += ","
-        if comment_text:
-            line += f"  -- {comment_text}"
-        ddl_lines.append(line)
+    # Emit all columns in one join; the comma must precede any inline comment,
+    # so it is baked into each line rather than used as the join separator
+    if cols:
+        last = len(cols) - 1
+        body = [
+            f"  {def_sql}{',' if i != last else ''}"
+            + (f"  -- {comment_text}" if comment_text else "")
+            for i, (def_sql, comment_text) in enumerate(cols)
+        ]
+        ddl_lines.append("\n".join(body))
 
     ddl_lines.append(");")
 
-    if warnings:
+    if warning_counts:
         ddl_lines.append("")
         ddl_lines.append("-- Warnings during generation:")
-        for w in warnings:
-            ddl_lines.append(f"--   {w}")
+        for (code, label), n in warning_counts.items():
+            ddl_lines.append(f"--   {format_warning(code, label, n)}")
 
+    if out is not None:
+        for line in ddl_lines:
+            out.write(line)
+            out.write("\n")
+        return None
     return "\n".join(ddl_lines)
 
 # -----------------------------
@@ -225,12 +303,14 @@ def main() -> None:
     ap.add_argument("--csv", required=True, help="Path to the 3-row CSV/TSV source")
     ap.add_argument("--delimiter", default=None, help="Force delimiter: ',', '\\t', ';', or '|'")
     ap.add_argument("--encoding", default="utf-8-sig", help="File encoding (default utf-8-sig)")
+    ap.add_argument("--no-cache", action="store_true", help="Do not reuse/store cached delimiter detection results")
     args = ap.parse_args()
 
     try:
-        desc, types, cols = read_three_row_csv(args.csv, args.delimiter, args.encoding)
-        ddl = generate_create_table_sql(args.table, desc, types, cols)
-        sys.stdout.write(ddl + "\n")
+        desc, types, cols = read_three_row_csv(args.csv, args.delimiter, args.encoding, use_cache=not args.no_cache)
+        # sys.stdout is already block-buffered when piped; stream the DDL
+        # into it instead of joining one large intermediate string
+        generate_create_table_sql(args.table, desc, types, cols, out=sys.stdout)
     except Exception as e:
         sys.stderr.write(f"Error: {e}\n")
         sys.exit(1)